@@ -1,5 +1,7 @@
 # config.py
 
+import re
+
 TOKEN_FILENAME = 'o365_token.txt'
 
 PROGRAM_EMAIL = 'DR-Report-Automation@redcross.org'
@@ -23,11 +25,30 @@ SHEET_REPORT_STATUS = 'Report Status'
 # default value for daily checkin nags
 LATE_CHECKIN_THRESHOLD = 3
 
+# default DaysRemain sheets for the SPS report: 'Days_2' is exactly 2 days left, 'Days_3..5' is 3 through 5
+DAYS_REMAIN_SHEETS = [ 'Days_2' ]
+DAYS_REMAIN_SHEET_RE = re.compile(r'^Days_(-?\d+)(?:\.\.(-?\d+))?$')
+
+
+#
+# parse a DaysRemain sheet name into (low, high): 'Days_2' is (2, 2), 'Days_3..5' is (3, 5)
+#
+def days_remain_window(sheet_name):
+
+    m = DAYS_REMAIN_SHEET_RE.match(sheet_name)
+    if m is None:
+        raise ValueError(f"bad DaysRemain sheet name '{ sheet_name }': should be like Days_2 or Days_3..5")
+
+    low = int(m.group(1))
+    high = int(m.group(2)) if m.group(2) is not None else low
+    return low, high
+
 
 _DR_CONFIGURATIONS = {}
 
 class DRConfig:
-    def __init__(self, dr_id, to_email, dr_path, send_email, subject_match_string=None, dr_folder_name=DR_FOLDER_NAME, from_email=None):
+    def __init__(self, dr_id, to_email, dr_path, send_email, subject_match_string=None, dr_folder_name=DR_FOLDER_NAME, from_email=None,
+                 days_remain_sheets=None):
         self._dr_id = dr_id
         self._from_email = from_email
         self._to_email = to_email
@@ -51,6 +72,9 @@ class DRConfig:
         self._subject_match_string = subject_match_string
 
         self._late_checkin_threshold = LATE_CHECKIN_THRESHOLD
+        self._days_remain_sheets = days_remain_sheets if days_remain_sheets is not None else DAYS_REMAIN_SHEETS
+        # parsed now, so a bad name is caught when the configuration loads rather than part way through a run
+        self._days_remain_windows = { name: days_remain_window(name) for name in self._days_remain_sheets }
 
         _DR_CONFIGURATIONS[self.dr_id] = self
 
@@ -130,6 +154,15 @@ class DRConfig:
     def late_checkin_threshold(self):
         return self._late_checkin_threshold
 
+    @property
+    def days_remain_sheets(self):
+        return self._days_remain_sheets
+
+    # sheet name -> (low, high) DaysRemain
+    @property
+    def days_remain_windows(self):
+        return self._days_remain_windows
+
     @staticmethod
     def lookup_dr(dr_id):
         if dr_id not in _DR_CONFIGURATIONS:
@@ -0,0 +1,148 @@
+# distribution_journal.py - remember what was built and who it was sent to, so a failed
+# distribution can be finished later without rebuilding the reports
+#
+# each report being distributed gets a directory under the journal directory holding:
+#   report.xlsx      the exact bytes that were being sent, until everyone on the list has them
+#   state.json       the report details and digest, the mailing list, and who has been sent to
+#
+# the report holds names, emails and phone numbers, so it is only kept while there is someone left to
+# send it to; state.json is all that is needed after that
+
+import os
+import re
+import json
+import logging
+import datetime
+import pathlib
+
+
+log = logging.getLogger(__name__)
+
+
+REPORT_FILE = "report.xlsx"
+STATE_FILE = "state.json"
+
+SENT = "sent"
+FAILED = "failed"
+
+
+class DistributionJournal:
+    def __init__(self, journal_dir, state):
+        self._journal_dir = pathlib.Path(journal_dir)
+        self._state = state
+
+    #
+    # start a new journal for a report, replacing whatever an earlier run left for the same report type.
+    # the emails in already_sent are recorded as sent, eg the people who got the same report last time
+    #
+    @classmethod
+    def start(cls, journal_dir, report_type, file_name, report_date, report_bytes, mailing_list, digest=None, already_sent=()):
+
+        journal_dir = report_journal_dir(journal_dir, report_type)
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        (journal_dir / REPORT_FILE).write_bytes(report_bytes)
+
+        state = {
+            'report_type': report_type,
+            'file_name': file_name,
+            'report_date': report_date.isoformat(),
+            'started': datetime.datetime.now().astimezone().isoformat(),
+            'digest': digest,
+            'mailing_list': [ recipient_entry(e) for e in mailing_list ],
+            'recipients': { email: { 'status': SENT } for email in already_sent },
+            }
+
+        journal = cls(journal_dir, state)
+        journal._write()
+        journal._remove_report_if_delivered()
+        return journal
+
+    #
+    # all the journals in journal_dir, oldest first
+    #
+    @classmethod
+    def load_all(cls, journal_dir):
+
+        journals = []
+        for state_file in pathlib.Path(journal_dir).glob(f"*/{ STATE_FILE }"):
+            with open(state_file, "r") as f:
+                journals.append(cls(state_file.parent, json.load(f)))
+
+        journals.sort(key=lambda j: j._state['started'])
+        return journals
+
+    #
+    # the journal of the last report of this type, or None if there isn't one
+    #
+    @classmethod
+    def load(cls, journal_dir, report_type):
+
+        state_file = report_journal_dir(journal_dir, report_type) / STATE_FILE
+        if not state_file.exists():
+            return None
+
+        with open(state_file, "r") as f:
+            return cls(state_file.parent, json.load(f))
+
+    @property
+    def report_type(self):
+        return self._state['report_type']
+
+    @property
+    def file_name(self):
+        return self._state['file_name']
+
+    @property
+    def digest(self):
+        return self._state.get('digest')
+
+    @property
+    def report_date(self):
+        return datetime.datetime.fromisoformat(self._state['report_date'])
+
+    def report_bytes(self):
+        return (self._journal_dir / REPORT_FILE).read_bytes()
+
+    def is_sent(self, email):
+        return self._state['recipients'].get(email, {}).get('status') == SENT
+
+    # the mailing list entries that haven't been sent to yet, including ones that failed
+    def pending_recipients(self):
+        return [ e for e in self._state['mailing_list'] if not self.is_sent(recipient_email(e)) ]
+
+    def mark_sent(self, email):
+        self._state['recipients'][email] = { 'status': SENT }
+        self._write()
+        self._remove_report_if_delivered()
+
+    def mark_failed(self, email, error):
+        log.debug(f"journal: { self.report_type } to { email } failed: { error }")
+        self._state['recipients'][email] = { 'status': FAILED, 'error': error }
+        self._write()
+
+    def _remove_report_if_delivered(self):
+        if len(self.pending_recipients()) == 0:
+            (self._journal_dir / REPORT_FILE).unlink(missing_ok=True)
+
+    def _write(self):
+        # write then rename, so a crash never leaves a half written state file
+        state_file = self._journal_dir / STATE_FILE
+        tmp_file = state_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp_file, state_file)
+
+
+def report_journal_dir(journal_dir, report_type):
+    return pathlib.Path(journal_dir) / re.sub(r'[^A-Za-z0-9]+', '_', report_type)
+
+
+# mailing list entries are either bare email addresses or roster rows; keep just what sending uses
+def recipient_entry(e):
+    if isinstance(e, str):
+        return e
+    return { 'Email': e['Email'], 'GAP(s)': e['GAP(s)'], 'Name': e['Name'] }
+
+
+def recipient_email(e):
+    return e if isinstance(e, str) else e['Email']
@@ -11,22 +11,38 @@ import io
 import typing
 import base64
 import pathlib
+import posixpath
+import pickle
+import hashlib
 import requests
 import requests.exceptions
 import textwrap
+import xml.sax.saxutils
+import copy
+import bisect
+import collections
+import itertools
+import zipfile
+import concurrent.futures
+import functools
 
 import xlrd
 import dotenv
 
 import openpyxl
 import openpyxl.utils
+import openpyxl.cell
 import openpyxl.styles
 import openpyxl.styles.colors
 import openpyxl.writer.excel
 import openpyxl.utils.cell
+import openpyxl.xml.functions
 #import O365.excel
 
 import config as config_static
+import upload_session
+import replay
+import distribution_journal
 import neil_tools
 import arc_o365
 #import o365_staffing
@@ -36,17 +52,25 @@ from neil_tools import spreadsheet_tools
 
 # index of column label row, origin zero
 STAFF_ROSTER_LABEL_ROW = 5
+STAFF_REQUESTS_LABEL_ROW = 1
+SHIFTS_LABEL_ROW = 3
+AIR_LABEL_ROW = 2
+ARRIVAL_LABEL_ROW = 4
 ORIG_SHEET_NAME = "Orig"
 REPORT_DATE_FORMAT = "%Y-%m-%d %H-%M-%S %Z"
 
 SHEET_COLOR = '99ff99'
 
+# default place to journal report distribution, for --resume
+JOURNAL_DIR = "journal"
 
 NOW = datetime.datetime.now().astimezone()
 NOW_NO_TZ = datetime.datetime.now()
 
 
 def main() -> None:
+    global NOW, NOW_NO_TZ
+
     args = parse_args()
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -61,12 +85,28 @@ def main() -> None:
         log.fatal(f"no configuration on file for '{ args.dr_id }'")
         sys.exit(1)
 
-    o365 = arc_o365.arc_o365.arc_o365(config, token_filename=config.TOKEN_FILENAME, timezone="America/Los_Angeles")
+    if args.replay:
+        # run against a recorded bundle, with local stand-ins for everything O365
+        report_dict, NOW, NOW_NO_TZ = replay.load_reports(args.replay)
+        o365_config = replay.ReplayConfig(dr_config, args.replay)
+    else:
+        o365 = arc_o365.arc_o365.arc_o365(config, token_filename=config.TOKEN_FILENAME, timezone="America/Los_Angeles")
+
+        # set up o365_config early, so we can add retrying failed transactions
+        o365_config = configuration.O365Config(dr_config, o365.account)
+
+    if args.resume:
+        # finish a previous run's distribution from its journal, without rebuilding anything
+        resume_distribution(dr_config, args, o365_config)
+        return
 
-    # set up o365_config early, so we can add retrying failed transactions
-    o365_config = configuration.O365Config(dr_config, o365.account)
+    if not args.replay:
+        report_dict = o365.fetch_workforce_reports(dr_config.dr_id, subject_match_string=dr_config.subject_match_string)
+
+        if args.record:
+            replay.record_reports(args.record, report_dict, NOW, NOW_NO_TZ)
+            replay.record_config_workbook(args.record, dr_config, o365.account)
 
-    report_dict = o365.fetch_workforce_reports(dr_config.dr_id, subject_match_string=dr_config.subject_match_string)
     report_date = report_dict['created']
     report_date_stamp = report_date.strftime(REPORT_DATE_FORMAT)
     log.debug(f"report date is '{ report_date }', stamp '{ report_date_stamp }'")
@@ -74,14 +114,24 @@ def main() -> None:
     errors = False
     book_out = openpyxl.Workbook()
 
+    # stamp the workbook with the report date rather than the time we happened to run,
+    # so the same reports always produce the same bytes
+    book_out.properties.created = report_date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    # each attachment is popped out of report_dict as it is parsed, so its bytes can be freed
+    # before the next report is read instead of all of them staying alive for the whole run
+
     # do the 'orig' roster first so it is at the end of the list
     sheet_name_roster0 = 'Roster0'
     sheet_name_roster1 = 'Roster1'
     # the cumulative roster has a bug: people assigned more than once doesn't show the current assignment.
     # use the checked in roster instead
-    sheet_orig = read_roster(book_out, ORIG_SHEET_NAME, report_dict['Staff Roster - Cumulative'], STAFF_ROSTER_LABEL_ROW, ROSTER_FIXUPS)
-    sheet_roster0 = read_roster(book_out, sheet_name_roster0, report_dict['Staff Roster - Checked In'], STAFF_ROSTER_LABEL_ROW, ROSTER_FIXUPS)
-    sheet_roster1 = copy_sheet(dr_config, book_out, sheet_roster0, STAFF_ROSTER_LABEL_ROW, sheet_name_roster1, filter_row_active, ROSTER_FIXUPS)
+    sheet_orig = read_roster(book_out, ORIG_SHEET_NAME, report_dict.pop('Staff Roster - Cumulative'), STAFF_ROSTER_LABEL_ROW, ROSTER_FIXUPS,
+                             cache_dir=args.cache_dir)
+    sheet_roster0 = read_roster(book_out, sheet_name_roster0, report_dict.pop('Staff Roster - Checked In'), STAFF_ROSTER_LABEL_ROW, ROSTER_FIXUPS)
+    sheet_roster1 = copy_sheet(dr_config, book_out, sheet_roster0, STAFF_ROSTER_LABEL_ROW, sheet_name_roster1, filter_row_active, ROSTER_FIXUPS,
+                               rows=sheet_roster0.iter_rows(values_only=True))
+    del book_out[sheet_name_roster0]
 
     # delete column 'I': the Released column
     # first delete the column
@@ -108,40 +158,40 @@ def main() -> None:
     # add the new one
     sheet_roster1.add_table(table)
 
+    read_roster(book_out, 'StaffRequests', report_dict.pop('Open Staff Requests'), STAFF_REQUESTS_LABEL_ROW, ROSTER_FIXUPS)
+    read_roster(book_out, 'Shifts', report_dict.pop('DRO Shift Tool - Shift Registrant Details'), SHIFTS_LABEL_ROW, SHIFTS_FIXUPS)
+    read_roster(book_out, 'Air', report_dict.pop('Air Travel Roster'), AIR_LABEL_ROW, AIR_FIXUPS, freeze_col="C", suppress_columns={'V':True})
+    read_roster(book_out, 'Arrival', report_dict.pop('Arrival Roster'), ARRIVAL_LABEL_ROW, ARRIVAL_FIXUPS, suppress_columns={'Z':True})
+
+    # pull the flight, arrival and shift data onto the roster rows as they are streamed from the sheet
+    roster1_rows = join_roster_rows(sheet_roster1.iter_rows(values_only=True), book_out)
+
     # and copy it to a new sheet to fix up all the column header widths
-    sheet_roster = copy_sheet(dr_config, book_out, sheet_roster1, 0, "Roster", {}, ROSTER_FIXUPS)
-    del book_out[sheet_name_roster0]
+    sheet_roster = copy_sheet(dr_config, book_out, sheet_roster1, 0, "Roster", {}, ROSTER_FIXUPS, rows=roster1_rows)
     del book_out[sheet_name_roster1]
 
+    # the derived sheets don't depend on each other; index the roster values once and render them all from that.
+    # the GAP group and threshold sheets are lookups on the index rather than a pass over the roster each
+    roster_index = RosterIndex(sheet_rows(sheet_roster), 0)
+    late_checkin_date = NOW_NO_TZ - datetime.timedelta(days=dr_config.late_checkin_threshold)
 
-    read_roster(book_out, 'StaffRequests', report_dict['Open Staff Requests'], 1, ROSTER_FIXUPS)
-    read_roster(book_out, 'Shifts', report_dict['DRO Shift Tool - Shift Registrant Details'], 3, SHIFTS_FIXUPS)
-    read_roster(book_out, 'Air', report_dict['Air Travel Roster'], 2, AIR_FIXUPS, freeze_col="C", suppress_columns={'V':True})
-    read_roster(book_out, 'Arrival', report_dict['Arrival Roster'], 4, ARRIVAL_FIXUPS, suppress_columns={'Z':True})
-
+    # the row numbers to include on each sheet
     sps_sheets = {
-        "Late_Checkin": filter_row_checkin,
-        "Need_SMS": filter_row_sms,
-        "Needs_Sup": filter_row_needs_sup,
-        "Days_2": filter_row_2_days,
-        "Outprocess": filter_row_overstayed,
+        "Late_Checkin": roster_index.checkin_before(late_checkin_date),
+        "Need_SMS": roster_index.matching(filter_row, filter_row_sms, dr_config),
+        "Needs_Sup": roster_index.matching(filter_row, filter_row_needs_sup, dr_config),
     }
-
-    all_sheets = {
-        "OM": filter_row_om,
-        "WF": filter_row_wf,
-        "IP": filter_row_ip,
-        "ER": filter_row_er,
-        "LOG": filter_row_log,
-        "CC": filter_row_cc,
-        "MC": filter_row_mc,
-        }
+    for sheet_name, (low, high) in dr_config.days_remain_windows.items():
+        sps_sheets[sheet_name] = roster_index.days_remain(low, high)
+    sps_sheets["Outprocess"] = roster_index.days_remain(None, 0)
 
     # make all the SPS sheets
-    for sheet_name, filter in sps_sheets.items():
-        copy_sheet(dr_config, book_out, sheet_roster, 0, sheet_name, filter, ROSTER_FIXUPS, sheet_color=SHEET_COLOR)
-    for sheet_name, filter in all_sheets.items():
-        copy_sheet(dr_config, book_out, sheet_roster, 0, sheet_name, filter, ROSTER_FIXUPS)
+    for sheet_name, row_numbers in sps_sheets.items():
+        copy_sheet(dr_config, book_out, sheet_roster, 0, sheet_name, {}, ROSTER_FIXUPS, sheet_color=SHEET_COLOR,
+                   rows=roster_index.select(row_numbers))
+    for sheet_name in GROUP_SHEETS:
+        copy_sheet(dr_config, book_out, sheet_roster, 0, sheet_name, {}, ROSTER_FIXUPS,
+                   rows=roster_index.select(roster_index.gap_group(sheet_name)))
 
     # remove the default sheet in a new wb that we don't need
     del book_out['Sheet']
@@ -151,6 +201,9 @@ def main() -> None:
     book_out.remove(sheet_roster)
     book_out._add_sheet(sheet_roster, index=0)
 
+    # headcount summary goes right after the roster
+    generate_summary_sheet(roster_index.labels, roster_index.data_rows(), book_out, "Summary", 1)
+
     # name of saved file
     roster_file_name = f"DR{ dr_config.dr_id } Staffing Report { report_date_stamp }.xlsx"
     roster_sps_file_name = f"DR{ dr_config.dr_id } SPS Report { report_date_stamp }.xlsx"
@@ -162,6 +215,9 @@ def main() -> None:
 
     # write out stuff to the config workbook
     last_report_date = o365_config.init_config_wb(roster_file_name, roster_sps_file_name, NOW, report_date)
+    if args.record:
+        replay.record_mailing_lists(args.record, mailing_list, mailing_list_sps, last_report_date)
+
     if last_report_date == report_date and args.ignore_too_soon != True:
         log.info(f"not running because report_date hasn't changed ({ report_date })")
         o365_config.update_report_status("Too Soon")
@@ -177,22 +233,135 @@ def main() -> None:
     if errors:
         sys.exit(1)
 
-    # send to SPS
-    do_distribution(dr_config, args, o365_config, book_out, "SPS Report", roster_sps_file_name,
-                    report_date, mailing_list_sps)
+    # the reports go to sharepoint as the same serialized bytes that are saved and mailed.
+    # chunked uploads can run in the background while the next report is built and mailed
+    upload_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    if args.replay:
+        upload_folder = o365_config.reports_folder()
+    else:
+        upload_folder = upload_session.reports_folder(dr_config, o365_config.account)
+
+    # get both reports ready (and journaled) before sending either, so if sending fails part way
+    # through --resume knows about both of them
+    distributions = []
 
-    # send the regular roster out
-    for sheet_name, filter in sps_sheets.items():
+    # the SPS report
+    distributions.append(prepare_distribution(dr_config, args, book_out, "SPS Report", roster_sps_file_name,
+                    report_date, mailing_list_sps, upload_pool, upload_folder))
+
+    # the regular roster
+    for sheet_name in sps_sheets:
         # delete the sps sheet
         del book_out[sheet_name]
 
-    do_distribution(dr_config, args, o365_config, book_out, "Staffing Report", roster_file_name,
-                    report_date, mailing_list)
+    distributions.append(prepare_distribution(dr_config, args, book_out, "Staffing Report", roster_file_name,
+                    report_date, mailing_list, upload_pool, upload_folder,
+                    group_sheet_names=GROUP_SHEETS if args.slim_attachments else None))
+
+    distributions = [ d for d in distributions if d is not None ]
+    for distribution in distributions:
+        send_distribution(dr_config, args, o365_config, distribution)
+
+    # wait for the uploads; this re-raises any upload failure
+    for distribution in distributions:
+        if distribution['upload'] is not None:
+            distribution['upload'].result()
+    upload_pool.shutdown()
 
     o365_config.update_report_status("Success")
 
 
 
+SUMMARY_DIMENSIONS = {
+        'GAP': 'GAP(s)',
+        'Region': 'Region',
+        'Lodging Tonight': 'Lodging Tonight',
+        'Work Location': 'Reporting/Work Location',
+        }
+
+# DaysRemain buckets for the summary: (title, low, high), either end None for no limit
+SUMMARY_DAYS_BUCKETS = [
+        ( '<= 0 days', None, 0 ),
+        ( '1-2 days', 1, 2 ),
+        ( '3-5 days', 3, 5 ),
+        ( '6-10 days', 6, 10 ),
+        ( '11+ days', 11, None ),
+        ]
+SUMMARY_NO_DAYS = 'No DaysRemain'
+SUMMARY_NO_GAP_GROUP = '(no GAP group)'
+
+#
+# generate a summary sheet with headcounts and DaysRemain distributions by GAP group, region,
+# lodging and work location, so people don't have to build pivot tables on the roster.
+#
+# everything is counted in a single pass over the roster's data rows, which may be streamed
+#
+def generate_summary_sheet(labels, data_rows, wb, summary_sheet_name, index):
+
+    column_name_map = { name: c for c, name in enumerate(labels) }
+    dimensions = { title: column_name_map[column] for title, column in SUMMARY_DIMENSIONS.items() if column in column_name_map }
+    days_col = column_name_map.get('DaysRemain')
+
+    bucket_titles = [ b[0] for b in SUMMARY_DAYS_BUCKETS ] + [ SUMMARY_NO_DAYS ]
+
+    # counts[dimension][value] is a Counter of bucket title, plus 'Headcount'
+    counts = { title: collections.defaultdict(collections.Counter) for title in dimensions }
+
+    for row in data_rows:
+        bucket = SUMMARY_NO_DAYS
+        if days_col is not None:
+            try:
+                days = int(row[days_col])
+                for title, low, high in SUMMARY_DAYS_BUCKETS:
+                    if (low is None or days >= low) and (high is None or days <= high):
+                        bucket = title
+                        break
+            except (TypeError, ValueError):
+                pass
+
+        for title, c in dimensions.items():
+            value = row[c]
+            if title == 'GAP' and value is not None and value != '':
+                # counted under the same GAP group as the group sheets, eg 'MC/SH/SA' -> 'MC'
+                value = gap_group(value) or SUMMARY_NO_GAP_GROUP
+            if value is None or value == '':
+                value = '(blank)'
+
+            counter = counts[title][value]
+            counter['Headcount'] += 1
+            counter[bucket] += 1
+
+    ws = wb.create_sheet(summary_sheet_name, index)
+    ws.column_dimensions['A'].width = 30
+    for c in range(0, len(bucket_titles) +1):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(c +2)].width = 12
+
+    # one table per dimension, stacked with a blank row between them; biggest groups first
+    row_num = 1
+    for title, by_value in counts.items():
+        if len(by_value) == 0:
+            continue
+
+        first_row = row_num
+        for c, value in enumerate([ title, 'Headcount' ] + bucket_titles):
+            ws.cell(row=row_num, column=c +1, value=value)
+
+        for value, counter in sorted(by_value.items(), key=lambda x: (-x[1]['Headcount'], str(x[0]))):
+            row_num += 1
+            ws.cell(row=row_num, column=1, value=value)
+            ws.cell(row=row_num, column=2, value=counter['Headcount'])
+            for c, bucket in enumerate(bucket_titles):
+                ws.cell(row=row_num, column=c +3, value=counter[bucket])
+
+        last_col_letter = openpyxl.utils.get_column_letter(len(bucket_titles) +2)
+        table_name = summary_sheet_name + "_" + re.sub(r'[^A-Za-z0-9_]', '_', title)
+        ws.add_table(openpyxl.worksheet.table.Table(displayName=table_name, ref=f"A{ first_row }:{ last_col_letter }{ row_num }"))
+
+        row_num += 2
+
+    return ws
+
+
 #
 # generate a contact sheet that can be imported to google contacts
 #
@@ -256,26 +425,354 @@ def generate_contact_sheet(dr_config, roster_table_dicts, wb, contact_sheet_name
 
 
 #
-# common code for sending both the SPS reports and the regular reports
+# common code for getting both the SPS reports and the regular reports ready to go out: serialize,
+# save, upload, and journal who it is going to.
+#
+# if group_sheet_names is given, recipients whose GAP group is one of those get a smaller
+# workbook without the other groups' sheets
+#
+# returns a dict for send_distribution(), including the future for a background chunked upload
+# (or None), or returns None if there is nothing more to do
 #
+def prepare_distribution(dr_config, args, book_out, report_name, file_name, report_date, mailing_list,
+                    upload_pool=None, upload_folder=None, group_sheet_names=None):
 
-def do_distribution(dr_config, args, o365_config, book_out, report_name, file_name, report_date, mailing_list):
+    if not (args.send or args.test_send or args.save):
+        return None
 
-    if args.send or args.test_send or args.save:
+    # serialize the workbook once into memory; the same bytes are used for the local copy, the
+    # sharepoint copy and every email attachment, so nothing has to round trip through the disk.
+    # The slim reports are cut down from the same parts
+    parts = workbook_parts(book_out)
+    report_bytes = package_parts(parts, args.compact, args.compress_level)
+    if args.compact:
+        log_report_sizes(book_out, report_bytes, file_name)
+
+    if args.save:
         log.debug(f"saving to { file_name }")
-        book_out.save(file_name)
-        o365_config.save_report_file(book_out, dr_config.reports_folder_name + "/" + file_name)
+        with open(file_name, "wb") as f:
+            f.write(report_bytes)
+
+    # the output is deterministic, so the same digest means the same report.  An unchanged report has
+    # already been uploaded, and only goes to the people on the list who didn't get it last time
+    digest = hashlib.sha256(report_bytes).hexdigest()
+    log.debug(f"{ file_name } digest { digest }")
+    unchanged = False
+    already_sent = []
+    if args.send and not args.send_unchanged:
+        previous = distribution_journal.DistributionJournal.load(args.journal_dir, report_name)
+        if previous is not None and previous.digest == digest:
+            unchanged = True
+            emails = [ distribution_journal.recipient_email(e) for e in mailing_list ]
+            already_sent = [ email for email in emails if previous.is_sent(email) ]
+            if len(already_sent) == len(emails):
+                log.info(f"{ file_name } is unchanged since it was last delivered; not uploading or sending it")
+                return None
+
+            log.info(f"{ file_name } is unchanged since it was last sent; not uploading it again, "
+                     f"only sending it to the { len(emails) - len(already_sent) } recipients who don't have it yet")
+
+    upload = None
+    if not unchanged:
+        if args.chunked_upload and not args.replay:
+            # only the chunks go to the background: the session is made here, on the O365 connection
+            # that the mail is sent through
+            upload_url = upload_session.create_upload_session(upload_folder, file_name)
+            upload = upload_pool.submit(upload_session.upload_to_session, upload_url, file_name, report_bytes)
+        else:
+            upload_session.save_report(upload_folder, file_name, report_bytes)
+
+    distribution = {
+            'report_name': report_name,
+            'file_name': file_name,
+            'report_date': report_date,
+            'report_bytes': report_bytes,
+            'mailing_list': mailing_list,
+            'journal': None,
+            'slim_reports': None,
+            'upload': upload,
+            }
+
+    if args.send or args.test_send:
+        # journal the list distribution so a failure part way through can be finished with --resume
+        if args.send:
+            distribution['journal'] = distribution_journal.DistributionJournal.start(args.journal_dir, report_name, file_name,
+                                                                     report_date, report_bytes, mailing_list, digest, already_sent)
 
-    try: 
-        if args.send or args.test_send:
-            send_roster(dr_config, args, o365_config.account, file_name, report_name, report_date, mailing_list)
-    except:
-        raise
+        if group_sheet_names is not None:
+            distribution['slim_reports'] = build_slim_reports(parts, mailing_list, group_sheet_names, args.compact, args.compress_level)
 
-    finally:
-        if not args.save and (args.send or args.test_send):
-            log.debug(f"removing { file_name }")
-            os.remove(file_name)
+    return distribution
+
+
+#
+# mail out a report from prepare_distribution()
+#
+def send_distribution(dr_config, args, o365_config, distribution):
+
+    if not (args.send or args.test_send):
+        return
+
+    send_roster(dr_config, args, o365_config.account, distribution['file_name'], distribution['report_bytes'],
+                distribution['report_name'], distribution['report_date'], distribution['mailing_list'],
+                journal=distribution['journal'], slim_reports=distribution['slim_reports'])
+
+
+#
+# save a workbook and return its package parts, with the save time taken out.
+#
+# the output is byte for byte the same for the same content: openpyxl stamps the save time into
+# docProps/core.xml and into every zip entry, so core.xml is replaced here with one carrying the
+# workbook's (fixed) creation time, and package_parts() gives every zip entry a fixed timestamp.
+# That lets us tell when a report hasn't changed.
+#
+# the parts are a list of (name, read), where read() returns the part's bytes.  The parts stay compressed
+# in openpyxl's save until they are read, so only one of them is ever held uncompressed at a time; a big
+# report's sheets are many times the size of the saved file.
+#
+def workbook_parts(book_out):
+
+    # openpyxl writes a sheet's outlineLevelCol from the column outlines it found the last time it wrote
+    # that sheet's columns, so a workbook's first save differs from the ones after it.  Work the outlines
+    # out before saving so that every save of the same content is the same
+    for ws in book_out.worksheets:
+        ws.column_dimensions.to_tree()
+
+    buffer = io.BytesIO()
+    book_out.save(buffer)
+
+    book_out.properties.modified = book_out.properties.created
+    core_xml = openpyxl.xml.functions.tostring(book_out.properties.to_tree())
+
+    # left open: the readers use it
+    zin = zipfile.ZipFile(buffer, "r")
+    return [ (info.filename, part_data(core_xml) if info.filename == CORE_PROPERTIES_PART else functools.partial(zin.read, info))
+            for info in zin.infolist() ]
+
+
+# a reader for a part whose bytes are already in hand
+def part_data(data):
+    return lambda: data
+
+
+#
+# zip up package parts from workbook_parts() into xlsx bytes.
+#
+# compact output also does something openpyxl won't do on its own: openpyxl writes every string
+# inline in its cell.  The roster columns (GAP(s), Region, lodging, locations, supervisors) are
+# very repetitive and repeated again on every derived sheet, so compact output moves the strings
+# into one workbook-wide shared strings table.
+#
+# compress_level (0-9) picks the deflate level for the xlsx zip.
+#
+def package_parts(parts, compact=False, compress_level=None):
+
+    if compact:
+        parts = share_strings(parts)
+
+    stable_buffer = io.BytesIO()
+    with zipfile.ZipFile(stable_buffer, "w") as zout:
+        for name, read in parts:
+            info = zipfile.ZipInfo(name, date_time=FIXED_ZIP_DATE_TIME)
+            zout.writestr(info, read(), compress_type=zipfile.ZIP_DEFLATED, compresslevel=compress_level)
+
+    return stable_buffer.getvalue()
+
+
+CORE_PROPERTIES_PART = "docProps/core.xml"
+FIXED_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+INLINE_STRING_RE = re.compile(r'<c ([^>]*?)t="inlineStr"><is><t([^>]*)>(.*?)</t></is></c>', re.DOTALL)
+SHARED_STRINGS_PART = "xl/sharedStrings.xml"
+
+#
+# rewrite openpyxl's inline string cells to index a shared strings table, and add the table to the package.
+# parts is a list of (name, read) from workbook_parts(); returns a new list.
+#
+# the sheets are rewritten as they are read, so the table is only complete once all of them have been;
+# it is the last part, and package_parts() reads the parts in order
+#
+def share_strings(parts):
+
+    strings = {}
+    count = 0
+
+    def share(match):
+        nonlocal count
+        count += 1
+        # the text is already xml escaped; identical escaped text is an identical string
+        key = (match.group(2), match.group(3))
+        index = strings.setdefault(key, len(strings))
+        return f'<c { match.group(1) }t="s"><v>{ index }</v></c>'
+
+    def shared(read):
+        return lambda: INLINE_STRING_RE.sub(share, read().decode("utf-8")).encode("utf-8")
+
+    def sst():
+        sst = [ '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>',
+               f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="{ count }" uniqueCount="{ len(strings) }">' ]
+        for t_attrs, text in strings:
+            sst.append(f'<si><t{ t_attrs }>{ text }</t></si>')
+        sst.append('</sst>')
+
+        log.debug(f"share_strings: { count } strings, { len(strings) } unique")
+        return "".join(sst).encode("utf-8")
+
+    new_parts = []
+    for name, read in parts:
+        if name.startswith("xl/worksheets/sheet"):
+            read = shared(read)
+        elif name == "[Content_Types].xml":
+            read = part_data(read().replace(b'</Types>',
+                    b'<Override PartName="/xl/sharedStrings.xml" '
+                    b'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml" /></Types>'))
+        elif name == "xl/_rels/workbook.xml.rels":
+            read = part_data(read().replace(b'</Relationships>',
+                    b'<Relationship Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+                    b'Target="/xl/sharedStrings.xml" Id="rIdSharedStrings" /></Relationships>'))
+        new_parts.append((name, read))
+
+    new_parts.append((SHARED_STRINGS_PART, sst))
+
+    return new_parts
+
+
+#
+# log how much of a saved report each sheet takes up, compressed
+#
+def log_report_sizes(book_out, report_bytes, file_name):
+
+    # openpyxl numbers the worksheet parts in workbook order
+    part_names = { f"xl/worksheets/sheet{ idx }.xml": ws.title for idx, ws in enumerate(book_out.worksheets, 1) }
+    part_names['xl/sharedStrings.xml'] = "(shared strings)"
+    part_names['xl/styles.xml'] = "(styles)"
+
+    with zipfile.ZipFile(io.BytesIO(report_bytes), "r") as z:
+        for info in z.infolist():
+            if info.filename in part_names:
+                log.info(f"{ file_name }: { part_names[info.filename] }: { info.compress_size } bytes ({ info.file_size } uncompressed)")
+
+    log.info(f"{ file_name }: total { len(report_bytes) } bytes")
+
+
+#
+# package one workbook for each group in the mailing list that has a sheet, leaving out the
+# sheets of the other groups.  Everyone in the same group shares the same bytes.  The slim workbooks
+# are cut down from the full report's parts (from workbook_parts()), so nothing is saved again.
+#
+# returns a dict from the gap_group() to the workbook bytes
+#
+def build_slim_reports(parts, mailing_list, group_sheet_names, compact=False, compress_level=None):
+
+    slim_reports = {}
+    for e in mailing_list:
+        if isinstance(e, str):
+            continue
+
+        group = gap_group(e['GAP(s)'])
+        if group not in group_sheet_names or group in slim_reports:
+            continue
+
+        other_groups = [ name for name in group_sheet_names if name != group ]
+        slim_reports[group] = package_parts(remove_sheets(parts, other_groups), compact, compress_level)
+
+        log.debug(f"build_slim_reports: { group } { len(slim_reports[group]) } bytes")
+
+    return slim_reports
+
+
+WORKBOOK_PART = "xl/workbook.xml"
+WORKBOOK_RELS_PART = "xl/_rels/workbook.xml.rels"
+CONTENT_TYPES_PART = "[Content_Types].xml"
+
+SHEET_ELEMENT_RE = re.compile(rb'<sheet [^>]*/>')
+RELATIONSHIP_ELEMENT_RE = re.compile(rb'<Relationship [^>]*/>')
+OVERRIDE_ELEMENT_RE = re.compile(rb'<Override [^>]*/>')
+ATTRIBUTE_RE = re.compile(rb'([\w:]+)="([^"]*)"')
+
+#
+# take sheets out of a workbook's package parts: the worksheet parts, their relationships and
+# whatever those point at (the sheet's tables), plus their entries in the workbook, the workbook
+# relationships and the content types.  Returns a new list of parts
+#
+def remove_sheets(parts, sheet_names):
+
+    parts_by_name = { name: read for name, read in parts }
+    workbook, workbook_rels, content_types = [ parts_by_name[name]() for name in (WORKBOOK_PART, WORKBOOK_RELS_PART, CONTENT_TYPES_PART) ]
+
+    def attributes(element):
+        return { k.decode(): xml.sax.saxutils.unescape(v.decode(), { '&quot;': '"' }) for k, v in ATTRIBUTE_RE.findall(element) }
+
+    def target_part(target, source_dir):
+        # relationship targets are either absolute or relative to the folder of the part they're from
+        return target[1:] if target.startswith('/') else posixpath.normpath(posixpath.join(source_dir, target))
+
+    workbook_targets = { }
+    for element in RELATIONSHIP_ELEMENT_RE.findall(workbook_rels):
+        a = attributes(element)
+        workbook_targets[a['Id']] = target_part(a['Target'], "xl")
+
+    removed_parts = set()
+    removed_ids = set()
+
+    def remove_sheet(match):
+        a = attributes(match.group(0))
+        if a['name'] not in sheet_names:
+            return match.group(0)
+
+        removed_ids.add(a['r:id'])
+        sheet_part = workbook_targets[a['r:id']]
+        removed_parts.add(sheet_part)
+
+        sheet_dir, sheet_file = posixpath.split(sheet_part)
+        sheet_rels_part = f"{ sheet_dir }/_rels/{ sheet_file }.rels"
+        if sheet_rels_part in parts_by_name:
+            removed_parts.add(sheet_rels_part)
+            for element in RELATIONSHIP_ELEMENT_RE.findall(parts_by_name[sheet_rels_part]()):
+                removed_parts.add(target_part(attributes(element)['Target'], sheet_dir))
+
+        return b''
+
+    workbook = SHEET_ELEMENT_RE.sub(remove_sheet, workbook)
+    # the active tab is an index into the sheets, which have moved; go back to the first one
+    workbook = re.sub(rb'activeTab="\d+"', b'activeTab="0"', workbook)
+
+    workbook_rels = RELATIONSHIP_ELEMENT_RE.sub(
+            lambda m: b'' if attributes(m.group(0))['Id'] in removed_ids else m.group(0),
+            workbook_rels)
+
+    content_types = OVERRIDE_ELEMENT_RE.sub(
+            lambda m: b'' if attributes(m.group(0))['PartName'].lstrip('/') in removed_parts else m.group(0),
+            content_types)
+
+    replaced = { WORKBOOK_PART: workbook, WORKBOOK_RELS_PART: workbook_rels, CONTENT_TYPES_PART: content_types }
+    return [ (name, part_data(replaced[name]) if name in replaced else read) for name, read in parts if name not in removed_parts ]
+
+
+#
+# send the reports from the distribution journal to everyone who didn't get them last time
+#
+def resume_distribution(dr_config, args, o365_config):
+
+    journals = distribution_journal.DistributionJournal.load_all(args.journal_dir)
+    if len(journals) == 0:
+        log.info(f"resume: no distribution journal in '{ args.journal_dir }'")
+        return
+
+    for journal in journals:
+        pending = journal.pending_recipients()
+        log.info(f"resume: { journal.file_name }: { len(pending) } recipients left")
+        if len(pending) == 0:
+            continue
+
+        send_roster(dr_config, args, o365_config.account, journal.file_name, journal.report_bytes(), journal.report_type,
+                    journal.report_date, pending, journal=journal)
+
+    # the config workbook has to be set up before the status can be written; use the journaled
+    # reports' details so it records the same run that is being finished
+    file_names = { journal.report_type: journal.file_name for journal in journals }
+    o365_config.init_config_wb(file_names.get("Staffing Report"), file_names.get("SPS Report"), NOW, journals[-1].report_date)
+    o365_config.update_report_status("Success")
 
 
 #
@@ -334,6 +831,9 @@ ROSTER_FIXUPS = {
                        'convert_value': lambda x: None if x is None else x if isinstance(x, int) else x if  x == '' or x == 'n/a' else int(x),
                        },
         'On Job': { 'width': 4, 'convert_value': lambda x: int(x) if isinstance(x, str) else x },
+        'Next Flight': { 'width': 16, 'number_format': "yyyy-mm-dd hh:mm", },
+        'Arrival Date': { 'width': 11, 'number_format': "yyyy-mm-dd", },
+        'Upcoming Shifts': { 'width': 8, },
     }
 
 ARRIVAL_FIXUPS = {
@@ -470,50 +970,145 @@ def fixup_cell_header(ws, c, fixup):
         ws.column_dimensions[col_letter].auto_size = True
 
 
-def fixup_cell(cell, fixup):
+#
+# style one prototype cell per column that has a number_format or alignment fixup.
+# openpyxl dedupes the number format and alignment against the workbook's style tables every time
+# they are set on a cell; doing that once per column and copying the resulting style array onto each
+# cell gives exactly the same styles (default font and all) for a fraction of the work.
+#
+# returns a dict from output column to style array (columns with no style are not included)
+#
+def fixup_styles(ws, fixups_by_col):
+
+    styles_by_col = {}
+    for c, fixup in fixups_by_col.items():
+        if 'number_format' not in fixup and 'alignment' not in fixup:
+            continue
+
+        # not added to the sheet; it only registers the formats with the workbook
+        proto = openpyxl.cell.Cell(ws)
+        if 'number_format' in fixup:
+            proto.number_format = fixup['number_format']
+        if 'alignment' in fixup:
+            proto.alignment = fixup['alignment']
+
+        styles_by_col[c] = proto._style
+
+    return styles_by_col
+
+
+def fixup_cell(cell, fixup, style=None):
 
     if 'convert_value' in fixup:
         #log.debug(f"cell { cell } old value { cell.value } isint { isinstance(cell.value, int) }")
         cell.value = fixup['convert_value'](cell.value)
+    if style is not None:
+        # precomputed by fixup_styles(); covers both number_format and alignment
+        cell._style = copy.copy(style)
+        return
     if 'number_format' in fixup:
         cell.number_format = fixup['number_format']
     if 'alignment' in fixup:
         #log.debug(f"setting cell { cell } alignment { fixup['alignment'] }")
         cell.alignment = fixup['alignment']
 
-# see if the responder is missing daily checkins.
-# the rule: last checkin over 3 days, or if never checked in: DRO checkin date over 3 days
-def filter_row_checkin_func(val, row, row_name_map, dr_config):
+filter_row_active = { 'Released': lambda x: x == '' }
+filter_row_needs_sup = { 'Current/Last Supervisor': lambda x: x != '' and x is not None and x == 'Needs Supervisor' }
+filter_row_sms = { 'Texts?': lambda x: x != 'opt-in' }
+# one sheet per GAP group, holding the people whose GAP(s) starts with the group, eg 'MC/'
+GROUP_SHEETS = [ "OM", "WF", "IP", "ER", "LOG", "CC", "MC" ]
 
-    checkin_warn_threshold = dr_config.late_checkin_threshold
-    dt_threshold = NOW_NO_TZ - datetime.timedelta(days=checkin_warn_threshold)
-    if isinstance(val, datetime.datetime):
-        if val < dt_threshold:
-            return True
-    else:
-        c = row_name_map['Checked in']
-        val = row[c]
-        if isinstance(val, datetime.datetime):
-            if val < dt_threshold:
-                return True
 
-    return False
+#
+# the GAP group of a GAP(s) entry: the part before the first '/', eg 'MC/SH/SA' -> 'MC'.
+# None if it isn't a GAP.  The group sheets, the Summary and the slim attachments all go by this
+#
+def gap_group(gap):
 
+    if not isinstance(gap, str) or '/' not in gap:
+        return None
 
-filter_row_active = { 'Released': lambda x: x == '' }
-filter_row_overstayed = { 'DaysRemain': lambda x: x != '' and x != 'n/a' and x is not None and int(x) <= 0 }
-filter_row_2_days = { 'DaysRemain': lambda x: x != '' and x != 'n/a' and x is not None and int(x) == 2 }
-filter_row_needs_sup = { 'Current/Last Supervisor': lambda x: x != '' and x is not None and x == 'Needs Supervisor' }
-filter_row_sms = { 'Texts?': lambda x: x != 'opt-in' }
-filter_row_mc = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('MC/') }
-filter_row_cc = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('CC/') }
-filter_row_log = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('LOG/') }
-filter_row_er = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('ER/') }
-filter_row_ip = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('IP/') }
-filter_row_wf = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('WF/') }
-filter_row_om = { 'GAP(s)': lambda x: isinstance(x, str) and x.startswith('OM/') }
+    return gap.split('/')[0]
 
-filter_row_checkin = { 'Last Daily Checkin': filter_row_checkin_func, 'extra_args': True }
+
+#
+# indexes over a roster snapshot (from sheet_rows()), built once per run:
+#   - the GAP group, from gap_group()
+#   - DaysRemain, for the rows where it is a number, sorted
+#   - the effective last checkin: Last Daily Checkin, or Checked in for people who have never done a daily checkin, sorted
+#
+# the queries return row numbers into the snapshot, in roster order
+#
+class RosterIndex:
+    def __init__(self, rows, label_row):
+        self._rows = rows
+        self._label_row = label_row
+        self.labels = rows[label_row]
+
+        column_name_map = { name: c for c, name in enumerate(rows[label_row]) }
+        gap_col = column_name_map.get('GAP(s)')
+        days_col = column_name_map.get('DaysRemain')
+        last_checkin_col = column_name_map.get('Last Daily Checkin')
+        checked_in_col = column_name_map.get('Checked in')
+
+        gap_groups = collections.defaultdict(list)
+        days = []
+        checkins = []
+        for r in range(label_row +1, len(rows)):
+            row = rows[r]
+
+            group = gap_group(row[gap_col]) if gap_col is not None else None
+            if group is not None:
+                gap_groups[group].append(r)
+
+            if days_col is not None:
+                try:
+                    days.append((int(row[days_col]), r))
+                except (TypeError, ValueError):
+                    # blank or 'n/a'
+                    pass
+
+            checkin = row[last_checkin_col] if last_checkin_col is not None else None
+            if not isinstance(checkin, datetime.datetime) and checked_in_col is not None:
+                checkin = row[checked_in_col]
+            if isinstance(checkin, datetime.datetime):
+                checkins.append((checkin, r))
+
+        days.sort()
+        checkins.sort()
+        self._gap_groups = gap_groups
+        self._days = days
+        self._days_keys = [ d for d, r in days ]
+        self._checkins = checkins
+        self._checkin_keys = [ d for d, r in checkins ]
+
+    # rows with low <= DaysRemain <= high; either end may be None for no limit
+    def days_remain(self, low=None, high=None):
+        start = 0 if low is None else bisect.bisect_left(self._days_keys, low)
+        end = len(self._days_keys) if high is None else bisect.bisect_right(self._days_keys, high)
+        return sorted(r for d, r in self._days[start:end])
+
+    # rows whose effective last checkin is before dt
+    def checkin_before(self, dt):
+        end = bisect.bisect_left(self._checkin_keys, dt)
+        return sorted(r for d, r in self._checkins[:end])
+
+    # rows in a GAP group
+    def gap_group(self, group):
+        return self._gap_groups.get(group, [])
+
+    # rows that pass a filter_row() style filter
+    def matching(self, filter_row, filter_defs, dr_config):
+        column_name_map = { name: c for c, name in enumerate(self.labels) }
+        return [ r for r in range(self._label_row +1, len(self._rows))
+                if filter_row(self._rows[r], column_name_map, filter_defs, dr_config) ]
+
+    # the label row plus the given rows, ready to hand to copy_sheet()
+    def select(self, row_numbers):
+        return [ self.labels ] + [ self._rows[r] for r in row_numbers ]
+
+    def data_rows(self):
+        return self._rows[self._label_row +1:]
 
 
 def filter_row(row, row_name_map, filter_defs, dr_config):
@@ -545,20 +1140,9 @@ def filter_row(row, row_name_map, filter_defs, dr_config):
     return True
 
 
-def read_roster(book_out, sheet_name, file_contents: str, label_row: int, fixups: dict, freeze_col: str = "B", suppress_columns: dict[str] = {}) -> openpyxl.worksheet.worksheet:
-    
-    book_in = xlrd.open_workbook(file_contents=file_contents)
-    sheet_in = book_in.sheet_by_index(0)
-
-    #log.debug(f"sheet name { sheet_in.name } rows { sheet_in.nrows } cols { sheet_in.ncols } label_row { label_row }")
-
-    #for col in range(0, sheet.ncols):
-    #    cell_value = sheet.cell_value(label_row, col)
-    #    log.debug(f"cell({ label_row }, { col }) = { cell_value }")
-
-    label_values = sheet_in.row_values(label_row)
-    #log.debug(f"label_values: { label_values }")
+def read_roster(book_out, sheet_name, file_contents: str, label_row: int, fixups: dict, freeze_col: str = "B", suppress_columns: dict[str] = {}, cache_dir: str = None) -> openpyxl.worksheet.worksheet:
 
+    label_values, columns = read_report_columns(sheet_name, file_contents, label_row, fixups, suppress_columns, cache_dir)
 
     # copy everything to a clean workbook
     sheet_orig = book_out.create_sheet(sheet_name, 0)
@@ -576,30 +1160,19 @@ def read_roster(book_out, sheet_name, file_contents: str, label_row: int, fixups
             log.error(f"read_roster: missing key: c { c } col_letter '{ col_letter }' output_col { output_col }")
         fixup_cell_header(sheet_orig, output_col, fixups_by_col[output_col])
         output_col += 1
-        
 
-    # copy cells
-    for r in range(0, sheet_in.nrows):
-        row = sheet_in.row_values(r)
+    styles_by_col = fixup_styles(sheet_orig, fixups_by_col)
 
-
-        output_c = 0
-        for c in range(0, sheet_in.ncols):
-            col_letter = openpyxl.utils.get_column_letter(c +1)
-            if col_letter in suppress_columns:
-                # skip this column
-                #log.debug(f"read_roster: suppressing columm '{ col_letter }'")
-                continue
-
-            
-            value = row[c]
+    # copy cells
+    for r, row in enumerate(zip(*columns)):
+        for output_c, value in enumerate(row):
             cell = sheet_orig.cell(row=r +1, column=output_c +1, value=value)
 
             # don't fix up cells before the actual data
             if r > label_row:
-                fixup_cell(cell, fixups_by_col[output_c])
-
-            output_c = output_c + 1
+                style = styles_by_col.get(output_c)
+                if style is not None:
+                    cell._style = copy.copy(style)
 
 
     # make a table if there is data
@@ -616,10 +1189,229 @@ def read_roster(book_out, sheet_name, file_contents: str, label_row: int, fixups
     return sheet_orig
 
 
+#
+# columns added to the roster from the other reports:
+#   (new column, source sheet, source label row, source date column, how to combine a person's dates)
+#
+#   'next':  the earliest date from now on
+#   'last':  the latest date
+#   'count': how many dates are from today on
+#
+ROSTER_JOINS = [
+        ( 'Next Flight', 'Air', AIR_LABEL_ROW, 'Departure time', 'next' ),
+        ( 'Arrival Date', 'Arrival', ARRIVAL_LABEL_ROW, 'Arrive date', 'last' ),
+        ( 'Upcoming Shifts', 'Shifts', SHIFTS_LABEL_ROW, 'Start Date', 'count' ),
+        ]
+
+# join keys, in order of preference
+ROSTER_JOIN_KEYS = [ 'Email', 'Name' ]
+
+
+def join_key(value):
+    if not isinstance(value, str):
+        return None
+    key = ' '.join(value.lower().split())
+    return key if key != '' else None
+
+
+#
+# add the ROSTER_JOINS columns to roster rows.  rows is any iterable of rows, the first being the labels;
+# the joined rows are generated one at a time, so the roster can be streamed straight from its sheet.
+#
+# each source sheet is hashed once by its join key (Email if it has one, otherwise Name), so the whole
+# join is a single pass over each sheet plus one over the roster.
+#
+def join_roster_rows(rows, wb):
+
+    rows = iter(rows)
+    labels = list(next(rows))
+    roster_columns = { name: c for c, name in enumerate(labels) }
+    today = NOW_NO_TZ.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # for each join: (sheet name, key name, roster key column, source key -> list of dates, how to combine)
+    joins = []
+    for column_title, sheet_name, source_label_row, date_column, combine in ROSTER_JOINS:
+        source_rows = sheet_rows(wb[sheet_name]) if sheet_name in wb else []
+        source_columns = { name: c for c, name in enumerate(source_rows[source_label_row]) } if len(source_rows) > source_label_row else {}
+
+        key_name = next((k for k in ROSTER_JOIN_KEYS if k in source_columns and k in roster_columns), None)
+        if key_name is None or date_column not in source_columns:
+            log.warning(f"join_roster_rows: can't join { sheet_name } onto the roster: no key column or no '{ date_column }' column")
+            joins.append(None)
+            continue
+
+        # hash the source sheet: key -> list of dates
+        key_c = source_columns[key_name]
+        date_c = source_columns[date_column]
+        dates_by_key = collections.defaultdict(list)
+        for row in source_rows[source_label_row +1:]:
+            key = join_key(row[key_c])
+            if key is not None:
+                value = row[date_c]
+                dates_by_key[key].append(value if isinstance(value, datetime.datetime) else None)
+
+        joins.append((sheet_name, key_name, roster_columns[key_name], dates_by_key, combine))
+
+    yield labels + [ j[0] for j in ROSTER_JOINS ]
+
+    matched = [ set() for join in joins ]
+    for row in rows:
+        row = list(row)
+
+        for join, join_matched in zip(joins, matched):
+            if join is None:
+                row.append('')
+                continue
+
+            sheet_name, key_name, roster_key_c, dates_by_key, combine = join
+            key = join_key(row[roster_key_c])
+            dates = [ d for d in dates_by_key.get(key, []) if d is not None ]
+            if key in dates_by_key:
+                join_matched.add(key)
+
+            if combine == 'count':
+                value = len([ d for d in dates if d >= today ])
+            elif combine == 'next':
+                upcoming = [ d for d in dates if d >= NOW_NO_TZ ]
+                value = min(upcoming) if len(upcoming) > 0 else ''
+            else:
+                value = max(dates) if len(dates) > 0 else ''
+
+            row.append(value)
+
+        yield row
+
+    for join, join_matched in zip(joins, matched):
+        if join is None:
+            continue
+
+        sheet_name, key_name, roster_key_c, dates_by_key, combine = join
+        unmatched = sorted(set(dates_by_key.keys()) - join_matched)
+        log.info(f"join_roster_rows: { sheet_name }: { len(join_matched) } of { len(dates_by_key) } people matched the roster by { key_name }")
+        if len(unmatched) > 0:
+            log.debug(f"join_roster_rows: { sheet_name }: not on the roster: { unmatched }")
+
+
+#
+# snapshot all the cell values of a sheet as a list of rows (lists, origin zero).
+#
+# iter_rows() has to recompute the sheet dimensions on every call, so fetching one row at a time
+# is quadratic in the size of the sheet.  Read everything in one pass instead and share the result
+# between all the sheets derived from it.
+#
+def sheet_rows(ws):
+    return [ list(row) for row in ws.iter_rows(values_only=True) ]
+
+
+#
+# parse a workforce report attachment into its label row and the converted values of the columns we keep.
+#
+# returns label_values (all columns, including suppressed ones) and a list of kept columns,
+# each a list of values from row zero through the last data row.
+#
+# if cache_dir is set the result is pickled there, keyed by a hash of the attachment and of the fixups.
+# The cumulative roster grows for the whole life of a DRO but often doesn't change between runs; when the
+# hash matches we skip xlrd and the conversions.  That is only the parsing: the sheet still has to be
+# rendered into the workbook, which is most of read_roster()'s time, so the saving is modest.
+#
+def read_report_columns(sheet_name, file_contents, label_row, fixups, suppress_columns, cache_dir=None):
+
+    cache_file = None
+    if cache_dir is not None:
+        digest = hashlib.sha256(file_contents)
+        digest.update(repr((fixups_cache_key(fixups), label_row, sorted(suppress_columns))).encode())
+        cache_file = pathlib.Path(cache_dir) / f"{ sheet_name }-{ digest.hexdigest() }.pickle"
+
+        if cache_file.exists():
+            log.debug(f"read_report_columns: using cached { sheet_name } from { cache_file }")
+            with open(cache_file, "rb") as f:
+                return pickle.load(f)
+
+    # we only ever look at the first sheet: have xlrd load sheets on demand and skip the formatting records
+    book_in = xlrd.open_workbook(file_contents=file_contents, on_demand=True, formatting_info=False)
+    sheet_in = book_in.sheet_by_index(0)
+
+    #log.debug(f"sheet name { sheet_in.name } rows { sheet_in.nrows } cols { sheet_in.ncols } label_row { label_row }")
+
+    label_values = sheet_in.row_values(label_row)
+    #log.debug(f"label_values: { label_values }")
+
+    fixups_by_col, column_name_map = row_fixups(fixups, label_values, suppress_columns)
+
+    # read the columns we keep as whole slices, stopping at the last row that has any data,
+    # and run the value conversions a column at a time
+    last_row = last_data_row(sheet_in)
+    columns = []
+    for c in range(0, sheet_in.ncols):
+        col_letter = openpyxl.utils.get_column_letter(c +1)
+        if col_letter in suppress_columns:
+            # skip this column
+            #log.debug(f"read_report_columns: suppressing columm '{ col_letter }'")
+            continue
+
+        values = sheet_in.col_values(c, 0, last_row +1)
+
+        # don't fix up cells before the actual data
+        fixup = fixups_by_col[len(columns)]
+        if 'convert_value' in fixup:
+            convert_value = fixup['convert_value']
+            values[label_row +1:] = [ convert_value(v) for v in values[label_row +1:] ]
+
+        columns.append(values)
+
+    book_in.release_resources()
+
+    if cache_file is not None:
+        # only keep the most recent version of each sheet
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        for old_file in cache_file.parent.glob(f"{ sheet_name }-*.pickle"):
+            old_file.unlink()
+
+        log.debug(f"read_report_columns: caching { sheet_name } in { cache_file }")
+        with open(cache_file, "wb") as f:
+            pickle.dump((label_values, columns), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return label_values, columns
+
+
+#
+# what about a set of fixups affects the cached values: the columns, their number formats and the
+# code of their convert_value functions, so editing a conversion invalidates the cache by itself
+#
+def fixups_cache_key(fixups):
+
+    def code_key(code):
+        # nested code objects (eg a lambda inside the function) repr with their address; use their contents
+        consts = tuple(code_key(c) if hasattr(c, 'co_code') else c for c in code.co_consts)
+        return (code.co_code, consts, code.co_names)
+
+    key = []
+    for name, fixup in sorted(fixups.items()):
+        convert_value = fixup.get('convert_value')
+        key.append((name, fixup.get('number_format'), code_key(convert_value.__code__) if convert_value is not None else None))
+
+    return repr(key)
+
+
+#
+# the workforce reports sometimes carry trailing blank rows; find the last row (origin zero) with data in it.
+# returns -1 for an empty sheet
+#
+def last_data_row(sheet_in):
+
+    for r in range(sheet_in.nrows -1, -1, -1):
+        for value in sheet_in.row_values(r):
+            if value != '' and value is not None:
+                return r
+
+    return -1
+
+
 # copy from the 'orig' sheet to a new sheet, filtering entries
 def copy_sheet(dr_config, wb, sheet_orig, label_row, sheet_name, filters, fixups,
                sheet_color: str = None,
-               suppress_columns: dict[str] = {}):
+               suppress_columns: dict[str] = {},
+               rows: typing.Iterable = None):
     
     #log.debug(f"copy_sheet: sheet_name { sheet_name } label_row { label_row }")
     #sheet_new = wb.create_sheet(sheet_name, len(wb.sheetnames)-1)
@@ -627,7 +1419,16 @@ def copy_sheet(dr_config, wb, sheet_orig, label_row, sheet_name, filters, fixups
     if sheet_color is not None:
         sheet_new.sheet_properties.tabColor = sheet_color
 
-    label_values = list(next(sheet_orig.iter_rows(min_row=label_row +1, max_row=label_row +2, values_only=True)))
+    # callers making several sheets from the same source can pass in a snapshot from sheet_rows();
+    # rows may also be streamed, eg from iter_rows(values_only=True), as they are only read once
+    if rows is None:
+        rows = sheet_rows(sheet_orig)
+
+    # the rows above the label row aren't copied
+    rows = iter(rows)
+    for r in range(0, label_row):
+        next(rows)
+    label_values = list(next(rows))
 
     # set column attributes
     fixups_by_col, column_name_map = row_fixups(fixups, label_values, suppress_columns)
@@ -642,16 +1443,15 @@ def copy_sheet(dr_config, wb, sheet_orig, label_row, sheet_name, filters, fixups
         fixup_cell_header(sheet_new, output_col, fixups_by_col[output_col])
         output_col += 1
 
-    # these two are origin one indexes
-    max_col = sheet_orig.max_column
-    max_row = sheet_orig.max_row
+    styles_by_col = fixup_styles(sheet_new, fixups_by_col)
 
-    # copy cells
+    # origin one index
+    max_col = len(label_values)
+
+    # copy cells, starting with the labels
     output_row = 1
-    for r in range(label_row, max_row):
-        row = list(sheet_orig.iter_rows(min_row=r +1, max_row=r +2, values_only=True))
-        row_values = list(row[0])
-        #log.debug(f"copy_sheet: row { row }")
+    for r, row_values in enumerate(itertools.chain([ label_values ], rows), label_row):
+        #log.debug(f"copy_sheet: row { row_values }")
 
         include_row = False
         if r > label_row:
@@ -675,7 +1475,7 @@ def copy_sheet(dr_config, wb, sheet_orig, label_row, sheet_name, filters, fixups
 
             # don't fix up cells before the actual data
             if r > label_row:
-                fixup_cell(cell, fixups_by_col[output_col])
+                fixup_cell(cell, fixups_by_col[output_col], styles_by_col.get(output_col))
             output_col += 1
 
         # increment the output row
@@ -687,8 +1487,10 @@ def copy_sheet(dr_config, wb, sheet_orig, label_row, sheet_name, filters, fixups
         last_col_letter = openpyxl.utils.get_column_letter(sheet_new.max_column)
 
         table_ref = f"A1:{ last_col_letter }{ sheet_new.max_row }"
-        log.debug(f"copy_sheet: adding table { sheet_name } table_ref '{ table_ref }'")
-        table_new = openpyxl.worksheet.table.Table(displayName=sheet_name, ref=table_ref)
+        # table names can only have letters, digits and underscores
+        table_name = re.sub(r'[^A-Za-z0-9_]', '_', sheet_name)
+        log.debug(f"copy_sheet: adding table { table_name } table_ref '{ table_ref }'")
+        table_new = openpyxl.worksheet.table.Table(displayName=table_name, ref=table_ref)
         sheet_new.add_table(table_new)
         sheet_new.freeze_panes = f"B2"
 
@@ -698,7 +1500,8 @@ def copy_sheet(dr_config, wb, sheet_orig, label_row, sheet_name, filters, fixups
 #
 # wrapper for sending out the roster
 #
-def send_roster(dr_config, args, account, file_name, report_type, report_date, mailing_list):
+def send_roster(dr_config, args, account, file_name, report_bytes, report_type, report_date, mailing_list, journal=None,
+                slim_reports=None):
 
     warn_days = 2
     if report_date < NOW - datetime.timedelta(days=warn_days):
@@ -712,6 +1515,13 @@ def send_roster(dr_config, args, account, file_name, report_type, report_date, m
         date_warning = ""
 
     if report_type == "SPS Report":
+        # only explain the range names if there are any
+        days_range_note = ""
+        range_sheets = [ name for name in dr_config.days_remain_sheets if '..' in name ]
+        if len(range_sheets) > 0:
+            low, high = dr_config.days_remain_windows[range_sheets[0]]
+            days_range_note = f" ({ range_sheets[0] } means { low } through { high } days)"
+
         sps_section = textwrap.dedent(
                 f"""
                 <p>
@@ -727,7 +1537,7 @@ def send_roster(dr_config, args, account, file_name, report_type, report_date, m
                     </p>
 
                     <p>
-                    The Days_2 worksheet has people with 2 days left on their deployment.
+                    The { ', '.join(dr_config.days_remain_sheets) } worksheet(s) have people with that many days left on their deployment{ days_range_note }.
                     It is common to reach out to these folks with a template with outprocessing instructions
                     </p>
 
@@ -781,6 +1591,10 @@ def send_roster(dr_config, args, account, file_name, report_type, report_date, m
         By default this is sorted by GAP, but you can easily re-sort it using the column headers
         </p>
 
+        <p>
+        The "Summary" worksheet has headcounts and days remaining by group, region, lodging and work location.
+        </p>
+
         <p>
         In addition there is a worksheet for every Group, with the responders in that group in that worksheet.
         </p>
@@ -803,15 +1617,17 @@ def send_roster(dr_config, args, account, file_name, report_type, report_date, m
 
         """)
 
-    send_report_common(dr_config, args, account, file_name, report_type, message_body, mailing_list)
+    send_report_common(dr_config, args, account, file_name, report_bytes, report_type, message_body, mailing_list, journal=journal,
+                       slim_reports=slim_reports)
 
 
 
 
-def send_report_common(dr_config, args, account, file_name, report_type, message_body, mailing_list):
+def send_report_common(dr_config, args, account, file_name, report_bytes, report_type, message_body, mailing_list, journal=None,
+                       slim_reports=None):
 
     if args.test_send:
-        send_report_common2(dr_config, args, account, file_name, report_type, message_body,
+        send_report_common2(dr_config, args, account, file_name, report_bytes, report_type, message_body,
                             dr_config.to_test, None, None)
 
     if args.send:
@@ -824,11 +1640,29 @@ def send_report_common(dr_config, args, account, file_name, report_type, message
                 email = e['Email']
                 gap = e['GAP(s)']
                 name = e['Name']
-            send_report_common2(dr_config, args, account, file_name, report_type, message_body, email, gap, name)
 
+            if journal is not None and journal.is_sent(email):
+                log.debug(f"already sent { file_name } to { email }")
+                continue
+
+            # people in a group get the slimmed workbook for it, if there is one
+            recipient_bytes = report_bytes
+            if slim_reports is not None:
+                recipient_bytes = slim_reports.get(gap_group(gap), report_bytes)
+
+            try:
+                send_report_common2(dr_config, args, account, file_name, recipient_bytes, report_type, message_body, email, gap, name)
+            except Exception as err:
+                if journal is not None:
+                    journal.mark_failed(email, str(err))
+                raise
+
+            if journal is not None:
+                journal.mark_sent(email)
 
 
-def send_report_common2(dr_config, args, account, file_name, report_type, message_body, email, gap, name):
+
+def send_report_common2(dr_config, args, account, file_name, report_bytes, report_type, message_body, email, gap, name):
 
     message = account.new_message(resource=dr_config.send_email)
     #message = account.new_message()
@@ -882,7 +1716,8 @@ def send_report_common2(dr_config, args, account, file_name, report_type, messag
 
 
     message.subject = file_name
-    message.attachments.add( file_name )
+    # attach from memory: a (BytesIO, name) pair, wrapped in a list so it isn't taken as two attachments
+    message.attachments.add([ (io.BytesIO(report_bytes), file_name) ])
 
     try:
         if not args.suppress_email:
@@ -902,10 +1737,34 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--save", help="retain output file", action="store_true")
     parser.add_argument("--send", help="send emails out", action="store_true")
     parser.add_argument("--test-send", help="send emails out, but to the test email box", action="store_true")
+    parser.add_argument("--chunked-upload", help="upload reports to sharepoint in resumable chunks, in the background", action="store_true")
+    parser.add_argument("--cache-dir", help="keep the parsed Orig (cumulative) roster here and reuse it when the report is unchanged", action="store")
+    parser.add_argument("--record", metavar="DIR", help="save the fetched reports and config workbook to DIR for later replay", action="store")
+    parser.add_argument("--replay", metavar="DIR", help="run against reports recorded in DIR, without any O365 access", action="store")
+    parser.add_argument("--compact", help="write reports with a shared strings table and log the size of each sheet", action="store_true")
+    parser.add_argument("--compress-level", help="deflate level (0-9) for the saved reports",
+                        type=int, choices=range(0, 10), metavar="N", action="store")
+    parser.add_argument("--slim-attachments", help="send people only their own group's sheet instead of every group's", action="store_true")
+    parser.add_argument("--send-unchanged", help="upload and send reports even if they are identical to the last ones delivered", action="store_true")
+    parser.add_argument("--journal-dir", help=f"where to keep the distribution journal (default: { JOURNAL_DIR }, or DIR/{ replay.OUTPUT_DIR }/{ JOURNAL_DIR } with --replay DIR)", action="store")
+    parser.add_argument("--resume", help="only finish sending the reports in the distribution journal; requires --send", action="store_true")
     parser.add_argument("--dr-id", help="Identifier for the DRO; must match the staffing report", required=True, action="store")
 
     args = parser.parse_args()
 
+    if args.record and args.replay:
+        parser.error("--record and --replay can't be used together")
+    if args.resume and not args.send:
+        parser.error("--resume requires --send")
+
+    # keep replays well away from the real journal: starting a journal replaces the last one for the
+    # same report, which would lose a pending --resume and the digest of what was really delivered
+    if args.journal_dir is None:
+        if args.replay:
+            args.journal_dir = os.path.join(args.replay, replay.OUTPUT_DIR, JOURNAL_DIR)
+        else:
+            args.journal_dir = JOURNAL_DIR
+
     return args
 
 
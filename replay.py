@@ -0,0 +1,239 @@
+# replay.py - record the inputs of a run, and play them back later without touching O365
+#
+# a recorded bundle is a directory holding:
+#   manifest.json          the report names, report dates and the times the run used
+#   <report name>.xls      one file per workforce report attachment
+#   Report Config.xlsx     the config workbook as it was at record time
+#   mailing_lists.json     the recipients the GAP patterns produced
+#
+# replaying a bundle runs the whole conversion and distribution against local stand-ins;
+# report files and "sent" messages end up in <bundle>/output
+
+import os
+import io
+import json
+import logging
+import datetime
+import pathlib
+
+import openpyxl
+import openpyxl.utils.cell
+
+
+log = logging.getLogger(__name__)
+
+
+MANIFEST_FILE = "manifest.json"
+MAILING_LISTS_FILE = "mailing_lists.json"
+OUTPUT_DIR = "output"
+
+
+#
+# save the fetched report_dict.  Attachments (bytes) go to their own files, everything else
+# (the 'created' date) into the manifest
+#
+def record_reports(record_dir, report_dict, now, now_no_tz):
+
+    record_dir = pathlib.Path(record_dir)
+    record_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = { 'reports': {}, 'dates': {}, 'now': now.isoformat(), 'now_no_tz': now_no_tz.isoformat() }
+    for name, value in report_dict.items():
+        if isinstance(value, bytes):
+            file_name = f"{ name }.xls"
+            (record_dir / file_name).write_bytes(value)
+            manifest['reports'][name] = file_name
+        elif isinstance(value, datetime.datetime):
+            manifest['dates'][name] = value.isoformat()
+        else:
+            log.warning(f"record_reports: not recording '{ name }' of type { type(value) }")
+
+    write_json(record_dir / MANIFEST_FILE, manifest)
+    log.info(f"recorded { len(manifest['reports']) } reports to { record_dir }")
+
+
+#
+# the inverse of record_reports(); returns report_dict, now, now_no_tz
+#
+def load_reports(replay_dir):
+
+    replay_dir = pathlib.Path(replay_dir)
+    manifest = read_json(replay_dir / MANIFEST_FILE)
+
+    report_dict = {}
+    for name, file_name in manifest['reports'].items():
+        report_dict[name] = (replay_dir / file_name).read_bytes()
+    for name, value in manifest['dates'].items():
+        report_dict[name] = datetime.datetime.fromisoformat(value)
+
+    now = datetime.datetime.fromisoformat(manifest['now'])
+    now_no_tz = datetime.datetime.fromisoformat(manifest['now_no_tz'])
+
+    return report_dict, now, now_no_tz
+
+
+#
+# keep a copy of the Report Config workbook with the recording.  It isn't needed to replay
+# (the recipients are recorded directly) but it is what the GAP patterns were run against
+#
+def record_config_workbook(record_dir, dr_config, account):
+
+    site = account.sharepoint().get_site(dr_config.sharepoint_site, dr_config.dr_path)
+    library = site.get_default_document_library()
+    item = library.get_item_by_path(dr_config.dr_folder_name + "/" + dr_config.report_config_file)
+    if item is None:
+        log.warning(f"record_config_workbook: could not find '{ dr_config.report_config_file }'")
+        return
+
+    item.download(to_path=record_dir, name=dr_config.report_config_file)
+
+
+#
+# the GAP matching rules live in the config workbook code; record what they produced so a replay
+# sends to exactly the same people
+#
+def record_mailing_lists(record_dir, mailing_list, mailing_list_sps, last_report_date):
+
+    write_json(pathlib.Path(record_dir) / MAILING_LISTS_FILE, {
+        'Staffing': mailing_list,
+        'SPS': mailing_list_sps,
+        'last_report_date': last_report_date.isoformat() if last_report_date is not None else None,
+        })
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+#
+# stands in for arc_o365's O365Config during a replay
+#
+class ReplayConfig:
+    def __init__(self, dr_config, replay_dir):
+        self._dr_config = dr_config
+        self._replay_dir = pathlib.Path(replay_dir)
+        self._output_dir = self._replay_dir / OUTPUT_DIR
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+
+        lists = read_json(self._replay_dir / MAILING_LISTS_FILE)
+        self._mailing_list = lists['Staffing']
+        self._mailing_list_sps = lists['SPS']
+        last = lists.get('last_report_date')
+        self._last_report_date = datetime.datetime.fromisoformat(last) if last is not None else None
+
+        self.account = ReplayAccount(self._output_dir)
+
+    def find_table_by_name(self, table_name, wb):
+        for ws in wb.worksheets:
+            if table_name in ws.tables:
+                return ws.title, ws.tables[table_name].ref
+        return None, None
+
+    def read_table_to_dict(self, table_name, wb):
+        sheet_name, table_ref = self.find_table_by_name(table_name, wb)
+        if sheet_name is None:
+            return []
+
+        min_col, min_row, max_col, max_row = openpyxl.utils.cell.range_boundaries(table_ref)
+        rows = wb[sheet_name].iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)
+        titles = next(rows)
+
+        # empty cells read back as '' from the xls reports
+        return [ { t: ('' if v is None else v) for t, v in zip(titles, row) } for row in rows ]
+
+    def run_gap_patterns(self, roster_table_dicts):
+        log.debug(f"replay: using { len(self._mailing_list) } recorded Staffing recipients")
+        return self._mailing_list
+
+    def run_gap_patterns_sps(self, roster_table_dicts):
+        log.debug(f"replay: using { len(self._mailing_list_sps) } recorded SPS recipients")
+        return self._mailing_list_sps
+
+    def init_config_wb(self, roster_file_name, roster_sps_file_name, now, report_date):
+        return self._last_report_date
+
+    def init_recipient_sheet(self):
+        pass
+
+    def update_recipient_sheet(self, mailing_list, list_name):
+        log.debug(f"replay: { list_name } recipients { len(mailing_list) }")
+
+    def update_report_status(self, status):
+        log.info(f"replay: report status '{ status }'")
+
+    # stands in for upload_session.reports_folder()
+    def reports_folder(self):
+        return ReplayFolder(self._output_dir)
+
+
+#
+# stands in for the sharepoint reports folder: uploaded reports are written to the output directory
+#
+class ReplayFolder:
+    def __init__(self, output_dir):
+        self._output_dir = output_dir
+
+    def upload_file(self, item, item_name=None, stream=None, stream_size=None):
+        out_path = self._output_dir / os.path.basename(item_name)
+        log.debug(f"replay: saving report to { out_path }")
+        out_path.write_bytes(stream.read())
+        return { 'name': item_name, 'size': stream_size }
+
+
+#
+# stands in for the O365 account: messages are written to the output directory instead of sent
+#
+class ReplayAccount:
+    def __init__(self, output_dir):
+        self._output_dir = output_dir
+        self.sent = []
+
+    def new_message(self, resource=None):
+        return ReplayMessage(self, resource)
+
+
+class ReplayMessage:
+    def __init__(self, account, resource):
+        self._account = account
+        self._resource = resource
+        self.to = ReplayList()
+        self.attachments = ReplayList()
+        self.subject = None
+        self.body = None
+
+    def send(self, save_to_sent_folder=False):
+        sent = {
+            'from': self._resource,
+            'to': self.to.items,
+            'subject': self.subject,
+            'attachments': [ attachment_summary(a) for a in self.attachments.items ],
+            }
+        self._account.sent.append(sent)
+        log.debug(f"replay: sent { sent }")
+
+        with open(self._account._output_dir / "sent.jsonl", "a") as f:
+            f.write(json.dumps(sent, default=str) + "\n")
+
+
+class ReplayList:
+    def __init__(self):
+        self.items = []
+
+    def add(self, items):
+        if isinstance(items, list):
+            self.items.extend(items)
+        else:
+            self.items.append(items)
+
+
+def attachment_summary(attachment):
+    # (BytesIO, name) pairs from send_report_common2
+    if isinstance(attachment, tuple) and isinstance(attachment[0], io.BytesIO):
+        return { 'name': attachment[1], 'size': attachment[0].getbuffer().nbytes }
+    return str(attachment)
@@ -0,0 +1,171 @@
+# test_upload_session.py - check the chunked upload against a fake upload session
+#
+# run with: python -m pytest
+
+import os
+import base64
+
+import pytest
+import requests.exceptions
+
+import upload_session
+
+
+#
+# a stand in for an upload session's url.  It keeps what it has been sent, answers like graph does,
+# and can be told to drop particular requests (counting puts and gets together, from 1)
+#
+class FakeSession:
+    def __init__(self, drop=()):
+        self.received = bytearray()
+        self.drop = set(drop)
+        self.requests = 0
+
+    def _maybe_drop(self):
+        self.requests += 1
+        if self.requests in self.drop:
+            raise requests.exceptions.ConnectionError(f"dropped request { self.requests }")
+
+    def put(self, url, headers, data, timeout):
+        self._maybe_drop()
+
+        byte_range, total = headers['Content-Range'].split(' ')[1].split('/')
+        start = int(byte_range.split('-')[0])
+        assert start == len(self.received)
+        self.received += data
+
+        if len(self.received) == int(total):
+            return FakeResponse(201, {
+                'size': len(self.received),
+                'file': { 'hashes': { 'quickXorHash': upload_session.quick_xor_hash(bytes(self.received)) } },
+                })
+        return FakeResponse(202, { 'nextExpectedRanges': [ f"{ len(self.received) }-" ] })
+
+    def get(self, url, timeout):
+        self._maybe_drop()
+        return FakeResponse(200, { 'nextExpectedRanges': [ f"{ len(self.received) }-" ] })
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(upload_session, "UPLOAD_RETRY_DELAY", 0)
+
+
+def report_bytes():
+    return os.urandom(upload_session.UPLOAD_CHUNK_UNIT * 3 + 1234)
+
+
+def upload(data, session):
+    item = upload_session.upload_chunks("http://upload", data, upload_session.UPLOAD_CHUNK_UNIT, session=session)
+    upload_session.verify_upload("report.xlsx", data, item)
+    return item
+
+
+def test_upload():
+    data = report_bytes()
+    session = FakeSession()
+
+    item = upload(data, session)
+
+    assert item['size'] == len(data)
+    assert bytes(session.received) == data
+    assert session.requests == 4
+
+
+def test_upload_resumes_after_dropped_chunk():
+    data = report_bytes()
+    session = FakeSession(drop={ 2 })
+
+    upload(data, session)
+
+    assert bytes(session.received) == data
+
+
+def test_upload_retries_while_link_stays_down():
+    # the second chunk is dropped, and so is the first attempt to ask where to resume from
+    data = report_bytes()
+    session = FakeSession(drop={ 2, 3 })
+
+    upload(data, session)
+
+    assert bytes(session.received) == data
+
+
+def test_upload_gives_up():
+    session = FakeSession(drop=range(1, 100))
+
+    with pytest.raises(upload_session.UploadError):
+        upload(report_bytes(), session)
+
+    assert session.requests == upload_session.UPLOAD_RETRIES +1
+
+
+#
+# a stand in for an O365 drive Folder, just enough to create an upload session
+#
+class FakeFolder:
+    object_id = "folder-id"
+
+    def __init__(self, body):
+        self.con = self
+        self.body = body
+        self.posted = []
+
+    def build_url(self, path):
+        return "https://graph" + path
+
+    def post(self, url, data):
+        self.posted.append(url)
+        # O365 returns None when the request failed
+        return FakeResponse(200, self.body) if self.body is not None else None
+
+
+def test_create_upload_session():
+    folder = FakeFolder({ 'uploadUrl': "http://upload" })
+
+    assert upload_session.create_upload_session(folder, "DR1 Staffing Report.xlsx") == "http://upload"
+    assert folder.posted == [ "https://graph/items/folder-id:/DR1%20Staffing%20Report.xlsx:/createUploadSession" ]
+
+
+def test_create_upload_session_fails():
+    with pytest.raises(upload_session.UploadError):
+        upload_session.create_upload_session(FakeFolder(None), "report.xlsx")
+
+
+def test_verify_upload_size_mismatch():
+    with pytest.raises(upload_session.UploadError):
+        upload_session.verify_upload("report.xlsx", b"12345", { 'size': 4 })
+
+
+# the quickXorHash as the onedrive docs describe it, a byte at a time
+def naive_quick_xor_hash(data):
+
+    mask = (1 << 160) -1
+    register = 0
+    for i, b in enumerate(data):
+        value = b << ((i * 11) % 160)
+        register ^= (value & mask) ^ (value >> 160)
+
+    result = bytearray(register.to_bytes(20, 'little'))
+    for i, b in enumerate(len(data).to_bytes(8, 'little')):
+        result[12 + i] ^= b
+
+    return base64.b64encode(bytes(result)).decode('ascii')
+
+
+@pytest.mark.parametrize("size", [ 0, 1, 159, 160, 161, 5000, 100003 ])
+def test_quick_xor_hash(size):
+    data = os.urandom(size)
+    assert upload_session.quick_xor_hash(data) == naive_quick_xor_hash(data)
@@ -0,0 +1,202 @@
+# upload_session.py - chunked, resumable uploads of report files to sharepoint
+
+import io
+import time
+import base64
+import logging
+import urllib.parse
+
+import requests
+import requests.exceptions
+
+
+log = logging.getLogger(__name__)
+
+
+# graph requires chunks to be a multiple of 320 KiB
+UPLOAD_CHUNK_UNIT = 320 * 1024
+UPLOAD_CHUNK_SIZE = UPLOAD_CHUNK_UNIT * 10
+
+# how many times in a row a chunk may fail before we give up on the upload
+UPLOAD_RETRIES = 5
+UPLOAD_RETRY_DELAY = 2
+UPLOAD_TIMEOUT = 60
+
+
+class UploadError(Exception):
+    pass
+
+
+#
+# find the sharepoint folder the reports are stored in
+#
+def reports_folder(dr_config, account):
+
+    site = account.sharepoint().get_site(dr_config.sharepoint_site, dr_config.dr_path)
+    library = site.get_default_document_library()
+    return library.get_item_by_path(dr_config.dr_folder_name + "/" + dr_config.reports_folder_name)
+
+
+#
+# save report_bytes as file_name into folder (an O365 drive Folder), replacing any existing file.
+# O365 does this in a single request, or in its own upload session for files over 4MB
+#
+def save_report(folder, file_name, report_bytes: bytes):
+
+    log.debug(f"save_report: saving { file_name } ({ len(report_bytes) } bytes)")
+    item = folder.upload_file(None, item_name=file_name, stream=io.BytesIO(report_bytes), stream_size=len(report_bytes))
+    if item is None:
+        raise UploadError(f"could not save '{ file_name }'")
+
+    return item
+
+
+#
+# create an upload session for file_name in folder (an O365 drive Folder) and return its upload url.
+#
+# this goes through the folder's authenticated connection, which is shared with everything else the
+# run does through O365 (and may refresh the token), so call it from the main thread.
+#
+def create_upload_session(folder, file_name) -> str:
+
+    url = folder.build_url(f"/items/{ folder.object_id }:/{ urllib.parse.quote(file_name) }:/createUploadSession")
+    response = folder.con.post(url, data={ "item": { "@microsoft.graph.conflictBehavior": "replace" } })
+    if not response:
+        raise UploadError(f"could not create an upload session for '{ file_name }'")
+
+    upload_url = response.json().get('uploadUrl')
+    if upload_url is None:
+        raise UploadError(f"upload session for '{ file_name }' has no uploadUrl")
+
+    return upload_url
+
+
+#
+# upload report_bytes as file_name to a session from create_upload_session(), and check what arrived.
+#
+# the upload url is pre-authorized, so this uses its own requests and none of O365's state; it is safe
+# to run in a background thread.  Returns the json for the new drive item.
+#
+def upload_to_session(upload_url: str, file_name, report_bytes: bytes, chunk_size: int = UPLOAD_CHUNK_SIZE):
+
+    log.debug(f"upload_to_session: uploading { file_name } ({ len(report_bytes) } bytes)")
+    item = upload_chunks(upload_url, report_bytes, chunk_size)
+    verify_upload(file_name, report_bytes, item)
+
+    return item
+
+
+#
+# send report_bytes to an upload session a chunk at a time.
+#
+# graph only accepts the chunks of a session in order, so they are sent one after another.  If a chunk
+# fails we ask the session which ranges it still expects and carry on from there, so a dropped
+# connection only costs the chunk in flight.  Asking can fail too if the link is still down; that
+# counts as another failure and is retried the same way.
+#
+def upload_chunks(upload_url: str, report_bytes: bytes, chunk_size: int = UPLOAD_CHUNK_SIZE, session=requests):
+
+    if chunk_size % UPLOAD_CHUNK_UNIT != 0:
+        raise ValueError(f"chunk_size { chunk_size } is not a multiple of { UPLOAD_CHUNK_UNIT }")
+
+    total = len(report_bytes)
+    offset = 0
+    failures = 0
+    resume = False
+
+    while True:
+        try:
+            if resume:
+                offset = resume_offset(upload_url, session)
+                resume = False
+
+            end = min(offset + chunk_size, total)
+            headers = {
+                    'Content-Length': str(end - offset),
+                    'Content-Range': f"bytes { offset }-{ end -1 }/{ total }",
+                    }
+
+            # this request must NOT carry the authorization header
+            response = session.put(upload_url, headers=headers, data=report_bytes[offset:end], timeout=UPLOAD_TIMEOUT)
+            if response.status_code in (200, 201):
+                # the last chunk: the response is the new drive item
+                return response.json()
+
+            response.raise_for_status()
+            offset = next_expected_offset(response.json(), end)
+            failures = 0
+
+        except requests.exceptions.RequestException as e:
+            failures += 1
+            if failures > UPLOAD_RETRIES:
+                raise UploadError(f"upload failed at offset { offset } after { UPLOAD_RETRIES } retries: { e }") from e
+
+            log.warning(f"upload_chunks: upload at { offset } failed ({ e }); retry { failures } of { UPLOAD_RETRIES }")
+            time.sleep(UPLOAD_RETRY_DELAY * failures)
+            resume = True
+
+
+#
+# ask an upload session where to pick up from after a failure
+#
+def resume_offset(upload_url: str, session=requests) -> int:
+
+    response = session.get(upload_url, timeout=UPLOAD_TIMEOUT)
+    response.raise_for_status()
+    return next_expected_offset(response.json(), 0)
+
+
+def next_expected_offset(status: dict, default: int) -> int:
+
+    # nextExpectedRanges looks like [ "12345-" ] or [ "12345-55555" ]
+    ranges = status.get('nextExpectedRanges')
+    if not ranges:
+        return default
+    return int(ranges[0].split('-')[0])
+
+
+#
+# check that what arrived is what we sent: the size always, the content hash if sharepoint gave us one
+#
+def verify_upload(file_name: str, report_bytes: bytes, item: dict):
+
+    size = item.get('size')
+    if size is not None and size != len(report_bytes):
+        raise UploadError(f"uploaded '{ file_name }' is { size } bytes, expected { len(report_bytes) }")
+
+    remote_hash = item.get('file', {}).get('hashes', {}).get('quickXorHash')
+    if remote_hash is not None:
+        local_hash = quick_xor_hash(report_bytes)
+        if remote_hash != local_hash:
+            raise UploadError(f"uploaded '{ file_name }' hash { remote_hash } does not match local hash { local_hash }")
+
+
+QUICK_XOR_WIDTH = 160
+QUICK_XOR_SHIFT = 11
+
+#
+# the quickXorHash that onedrive and sharepoint report for files: every byte is xored into a 160 bit
+# circular register, each one 11 bits further along than the last, and the length is folded in at the end.
+#
+def quick_xor_hash(data: bytes) -> str:
+
+    width_bytes = QUICK_XOR_WIDTH // 8
+
+    # byte i lands at bit (i * 11) % 160, which repeats every 160 bytes.  So first xor together all the
+    # bytes that land in the same place, 160 bytes at a time as one big integer.
+    folded = 0
+    for start in range(0, len(data), QUICK_XOR_WIDTH):
+        folded ^= int.from_bytes(data[start:start + QUICK_XOR_WIDTH], 'little')
+    folded_bytes = folded.to_bytes(QUICK_XOR_WIDTH, 'little')
+
+    mask = (1 << QUICK_XOR_WIDTH) -1
+    register = 0
+    for i, b in enumerate(folded_bytes):
+        value = b << ((i * QUICK_XOR_SHIFT) % QUICK_XOR_WIDTH)
+        register ^= (value & mask) ^ (value >> QUICK_XOR_WIDTH)
+
+    result = bytearray(register.to_bytes(width_bytes, 'little'))
+    for i, b in enumerate(len(data).to_bytes(8, 'little')):
+        result[width_bytes - 8 + i] ^= b
+
+    return base64.b64encode(bytes(result)).decode('ascii')